@@ -81,6 +81,20 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# The scoreboard caches rendered HTML and invalidates it from model signals.
+# A local-memory cache is only seen by its own process, so when running more
+# than one worker process switch this to a shared backend (Redis, Memcached
+# or the database cache); otherwise other workers keep serving stale tables.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
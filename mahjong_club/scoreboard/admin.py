@@ -7,7 +7,9 @@ from .models import Player, Week, Transaction, Pool
 class PlayerAdmin(admin.ModelAdmin):
     list_display = ["name", "total_score", "created_at"]
     search_fields = ["name"]
-    readonly_fields = ["created_at"]
+    # Running totals are maintained from the ledger; editing them here would
+    # write back stale values over sessions entered since the form loaded
+    readonly_fields = ["current_weekly_total", "current_payin_payout", "created_at"]
 
 
 @admin.register(Week)
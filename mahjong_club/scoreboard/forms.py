@@ -3,6 +3,12 @@ from django import forms
 from datetime import date
 from .models import Transaction, Player
 
+# Transaction types offered for manual input
+_LIMITED_TXN_CHOICES = (
+    (Transaction.TransactionType.SESSION.value, "Session Score"),
+    (Transaction.TransactionType.PAYIN_OUT.value, "Pay-in/Out"),
+)
+
 
 class TransactionForm(forms.ModelForm):
     class Meta:
@@ -10,7 +16,13 @@ class TransactionForm(forms.ModelForm):
         fields = ["player", "transaction_type", "weekday", "value", "description"]
         widgets = {
             "player": forms.Select(attrs={"class": "form-control"}),
-            "transaction_type": forms.Select(attrs={"class": "form-control"}),
+            "transaction_type": forms.Select(
+                attrs={
+                    "class": "form-control",
+                    # Lets the page script show the weekday field for sessions
+                    "data-session-value": Transaction.TransactionType.SESSION.value,
+                }
+            ),
             "weekday": forms.Select(attrs={"class": "form-control"}),
             "value": forms.NumberInput(attrs={"class": "form-control", "step": "0.01"}),
             "description": forms.Textarea(attrs={"class": "form-control", "rows": 3}),
@@ -21,14 +33,16 @@ class TransactionForm(forms.ModelForm):
         self.fields["player"].queryset = Player.objects.filter(
             name__isnull=False
         ).order_by("name")
+        # Render from the cached player list; the queryset is only hit on validation
+        self.fields["player"].choices = [
+            ("", self.fields["player"].empty_label),
+            *Player.get_choices(),
+        ]
         self.fields["player"].required = True
         # Limit transaction types for user input
-        self.fields["transaction_type"].choices = [
-            ("SESSION", "Session Score"),
-            ("PAYIN/OUT", "Pay-in/Out"),
-        ]
+        self.fields["transaction_type"].choices = _LIMITED_TXN_CHOICES
         self.fields["weekday"].required = False
-        self.fields["weekday"].initial = Transaction.WEEKDAYS[date.today().weekday()][0]
+        self.fields["weekday"].initial = date.today().isoweekday()
         self.fields["description"].required = False
 
 
@@ -0,0 +1,15 @@
+# rebuild_running_totals.py
+from django.core.management.base import BaseCommand
+from scoreboard.models import Player
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute players' weekly running totals from the current week's transactions"
+    )
+
+    def handle(self, *args, **options):
+        updated = Player.rebuild_running_totals()
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt running totals for {updated} players")
+        )
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-15 06:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scoreboard", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["week", "player"], name="scoreboard__week_id_43f848_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["week", "transaction_type", "weekday"],
+                name="scoreboard__week_id_a694f0_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["week", "is_reverted"], name="scoreboard__week_id_cf7381_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="week",
+            index=models.Index(
+                fields=["is_current"], name="scoreboard__is_curr_51e6f7_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-15 06:25
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_running_totals(apps, schema_editor):
+    Player = apps.get_model("scoreboard", "Player")
+    Transaction = apps.get_model("scoreboard", "Transaction")
+    fields = {"SESSION": "current_weekly_total", "PAYIN/OUT": "current_payin_payout"}
+    rows = (
+        Transaction.objects.filter(
+            week__is_current=True,
+            player__isnull=False,
+            transaction_type__in=fields,
+        )
+        .values("player_id", "transaction_type")
+        .annotate(total=Sum("value"))
+    )
+    for row in rows:
+        Player.objects.filter(pk=row["player_id"]).update(
+            **{fields[row["transaction_type"]]: row["total"]}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scoreboard", "0002_transaction_week_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="player",
+            name="current_payin_payout",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name="player",
+            name="current_weekly_total",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(backfill_running_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,149 @@
+from django.db import migrations, models
+from django.db.models import Case, Value, When
+
+TRANSACTION_TYPES = {
+    "PAYIN/OUT": 1,
+    "SESSION": 2,
+    "CASHBACK": 3,
+    "CASHBACK_DEDUCTION": 4,
+    "POOL_ADDITION": 5,
+}
+WEEKDAYS = {
+    "Monday": 1,
+    "Tuesday": 2,
+    "Wednesday": 3,
+    "Thursday": 4,
+    "Friday": 5,
+    "Saturday": 6,
+    "Sunday": 7,
+}
+
+
+def _mapped(source, target, mapping):
+    return Case(
+        *(When(**{source: old}, then=Value(new)) for old, new in mapping.items()),
+        output_field=target,
+    )
+
+
+def encode_choices(apps, schema_editor):
+    Transaction = apps.get_model("scoreboard", "Transaction")
+    Transaction.objects.update(
+        transaction_type_code=_mapped(
+            "transaction_type", models.SmallIntegerField(), TRANSACTION_TYPES
+        ),
+        weekday_code=_mapped("weekday", models.SmallIntegerField(), WEEKDAYS),
+    )
+
+
+def decode_choices(apps, schema_editor):
+    Transaction = apps.get_model("scoreboard", "Transaction")
+    Transaction.objects.update(
+        transaction_type=_mapped(
+            "transaction_type_code",
+            models.CharField(),
+            {new: old for old, new in TRANSACTION_TYPES.items()},
+        ),
+        weekday=_mapped(
+            "weekday_code",
+            models.CharField(),
+            {new: old for old, new in WEEKDAYS.items()},
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scoreboard", "0003_player_running_totals"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="transaction",
+            name="scoreboard__week_id_a694f0_idx",
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="transaction_type_code",
+            field=models.SmallIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="weekday_code",
+            field=models.SmallIntegerField(null=True),
+        ),
+        # Nullable while both representations exist, so reversing can re-add the
+        # text column empty, let decode_choices fill it, then restore NOT NULL
+        migrations.AlterField(
+            model_name="transaction",
+            name="transaction_type",
+            field=models.CharField(
+                choices=[
+                    ("PAYIN/OUT", "Pay-in/Out"),
+                    ("SESSION", "Session Score"),
+                    ("CASHBACK", "Cashback"),
+                    ("CASHBACK_DEDUCTION", "Cashback Deduction"),
+                    ("POOL_ADDITION", "Pool Addition"),
+                ],
+                max_length=20,
+                null=True,
+            ),
+        ),
+        migrations.RunPython(encode_choices, decode_choices),
+        migrations.RemoveField(
+            model_name="transaction",
+            name="transaction_type",
+        ),
+        migrations.RemoveField(
+            model_name="transaction",
+            name="weekday",
+        ),
+        migrations.RenameField(
+            model_name="transaction",
+            old_name="transaction_type_code",
+            new_name="transaction_type",
+        ),
+        migrations.RenameField(
+            model_name="transaction",
+            old_name="weekday_code",
+            new_name="weekday",
+        ),
+        migrations.AlterField(
+            model_name="transaction",
+            name="transaction_type",
+            field=models.SmallIntegerField(
+                choices=[
+                    (1, "Pay-in/Out"),
+                    (2, "Session Score"),
+                    (3, "Cashback"),
+                    (4, "Cashback Deduction"),
+                    (5, "Pool Addition"),
+                ]
+            ),
+        ),
+        migrations.AlterField(
+            model_name="transaction",
+            name="weekday",
+            field=models.SmallIntegerField(
+                blank=True,
+                choices=[
+                    (1, "Monday"),
+                    (2, "Tuesday"),
+                    (3, "Wednesday"),
+                    (4, "Thursday"),
+                    (5, "Friday"),
+                    (6, "Saturday"),
+                    (7, "Sunday"),
+                ],
+                null=True,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["week", "transaction_type", "weekday"],
+                name="scoreboard__week_id_a694f0_idx",
+            ),
+        ),
+    ]
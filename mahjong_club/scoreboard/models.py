@@ -1,13 +1,59 @@
 # models.py
-from django.db import models
-from django.db.models import Sum
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import (
+    Case,
+    DecimalField,
+    Exists,
+    F,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce, Round
 from django.utils import timezone
 from decimal import Decimal
 
+PLAYER_CHOICES_CACHE_KEY = "scoreboard:player_choices"
+POOL_CACHE_KEY = "scoreboard:pool"
+SCOREBOARD_TABLE_CACHE_KEY = "scoreboard:table"
+SCOREBOARD_TABLE_VERSION_KEY = "scoreboard:table_version"
+
+WEEKDAY_NAMES = (
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+    "Sunday",
+)
+
+ZERO = Decimal("0")
+# Output field for money expressions, matching the model columns
+AMOUNT_FIELD = DecimalField(max_digits=10, decimal_places=2)
+# Cashback tiers as (lookup, weekly total threshold, change to the player's score),
+# checked in order. Winners pay into the pool and losers receive from it.
+CASHBACK_TIERS = (
+    ("gte", Decimal("500"), Decimal("-100")),
+    ("gte", Decimal("200"), Decimal("-50")),
+    ("lte", Decimal("-500"), Decimal("100")),
+    ("lte", Decimal("-200"), Decimal("50")),
+)
+
 
 class Player(models.Model):
     name = models.CharField(max_length=100, unique=True)
     total_score = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # Running totals for the current week, maintained by Transaction.save()
+    current_weekly_total = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0
+    )
+    current_payin_payout = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -16,43 +62,40 @@ class Player(models.Model):
     def __str__(self):
         return self.name
 
-    def get_payin_payout_balance(self):
-        """Calculate total pay-in/pay-out balance for current week"""
-        balance = Transaction.objects.filter(
-            player=self,
-            transaction_type=Transaction.TransactionType.PAYIN_OUT,
-        ).aggregate(total=Sum("value"))["total"] or Decimal("0")
-        return balance
-
-    def get_weekly_total(self):
-        """Calculate total for the current week including sessions and pay-in/out"""
-        current_week = Week.get_current_week()
-        total = Transaction.objects.filter(
-            player=self,
-            week=current_week,
-            transaction_type=Transaction.TransactionType.SESSION,
-        ).aggregate(total=Sum("value"))["total"] or Decimal("0")
-        return total
-
-    def get_session_scores(self):
-        """Get session scores for each weekday"""
-        current_week = Week.get_current_week()
-        weekdays = [
-            "Monday",
-            "Tuesday",
-            "Wednesday",
-            "Thursday",
-            "Friday",
-            "Saturday",
-            "Sunday",
-        ]
-        scores = {}
-        for day in weekdays:
-            score = Transaction.objects.filter(
-                player=self, week=current_week, transaction_type="SESSION", weekday=day
-            ).aggregate(total=Sum("value"))["total"] or Decimal("0")
-            scores[day] = score
-        return scores
+    @classmethod
+    def get_choices(cls):
+        """Get cached (id, name) pairs for all players, ordered by name"""
+        return cache.get_or_set(
+            PLAYER_CHOICES_CACHE_KEY,
+            lambda: list(cls.objects.order_by("name").values_list("id", "name")),
+            timeout=300,
+        )
+
+    @classmethod
+    @transaction.atomic
+    def rebuild_running_totals(cls):
+        """Recompute every player's weekly running totals from the current week's ledger
+
+        Repairs the counters after writes that bypass Transaction.save(), such
+        as QuerySet.update(), bulk_create() or raw SQL.
+        """
+        totals = {}
+        for transaction_type, field in Transaction.RUNNING_TOTAL_FIELDS.items():
+            ledger_total = (
+                Transaction.objects.filter(
+                    player=OuterRef("pk"),
+                    week__is_current=True,
+                    transaction_type=transaction_type,
+                )
+                .values("player")
+                .annotate(total=Sum("value"))
+                .values("total")
+            )
+            totals[field] = Coalesce(
+                Subquery(ledger_total, output_field=AMOUNT_FIELD),
+                Value(ZERO, output_field=AMOUNT_FIELD),
+            )
+        return cls.objects.update(**totals)
 
 
 class Week(models.Model):
@@ -66,6 +109,7 @@ class Week(models.Model):
     class Meta:
         ordering = ["-year", "-week_number"]
         unique_together = ["week_number", "year"]
+        indexes = [models.Index(fields=["is_current"])]
 
     def __str__(self):
         return f"Week {self.week_number}, {self.year}"
@@ -82,32 +126,73 @@ class Week(models.Model):
             )
         return current_week
 
+    def get_settlements(self):
+        """Annotate every player with this week's session total and cashback change
+
+        cashback_change is applied to the player's score: winners pay into the
+        pool (negative change) and losers receive from it (positive change).
+        """
+        session_total = (
+            Transaction.objects.filter(
+                player=OuterRef("pk"),
+                week=self,
+                transaction_type=Transaction.TransactionType.SESSION,
+            )
+            .values("player")
+            .annotate(total=Sum("value"))
+            .values("total")
+        )
+        return Player.objects.annotate(
+            # Round in SQL so the tier lookups compare cents, not a float SUM
+            weekly_total=Coalesce(
+                Round(Subquery(session_total, output_field=AMOUNT_FIELD), 2),
+                Value(ZERO, output_field=AMOUNT_FIELD),
+            ),
+            cashback_change=Case(
+                *(
+                    When(**{f"weekly_total__{lookup}": threshold}, then=Value(change))
+                    for lookup, threshold, change in CASHBACK_TIERS
+                ),
+                default=Value(ZERO),
+                output_field=AMOUNT_FIELD,
+            ),
+        )
+
     @classmethod
+    @transaction.atomic
     def start_new_week(cls):
         """Process 'New Week' - finalize current week and start a new one"""
-        current_week = cls.get_current_week()
-        pool = Pool.get_pool()
-        cashback_total = Decimal("0")
+        # Lock the current week and the pool so concurrent rollovers serialize.
+        # Re-check is_current under the lock: a rollover that waited on it finds
+        # the week already finalized and must not settle a different one.
+        current_week = (
+            cls.objects.select_for_update()
+            .filter(pk=cls.get_current_week().pk, is_current=True)
+            .first()
+        )
+        if current_week is None:
+            raise ValueError(
+                "The current week was already finalized by another rollover"
+            )
+        pool = Pool.get_pool_for_update()
+        cashback_total = ZERO
 
         # Validate that for each weekday, the sum of SESSION transactions across all players is zero
-        weekdays = [
-            "Monday",
-            "Tuesday",
-            "Wednesday",
-            "Thursday",
-            "Friday",
-            "Saturday",
-            "Sunday",
-        ]
-        imbalanced = []
-        for day in weekdays:
-            total_for_day = Transaction.objects.filter(
+        day_totals = dict(
+            Transaction.objects.filter(
                 week=current_week,
                 transaction_type=Transaction.TransactionType.SESSION,
-                weekday=day,
-            ).aggregate(total=Sum("value"))["total"] or Decimal("0")
-            if total_for_day != Decimal("0"):
-                imbalanced.append((day, total_for_day))
+            )
+            .values("weekday")
+            # Rounded to cents so float noise in SQLite's SUM doesn't read as imbalance
+            .annotate(total=Round(Sum("value"), 2))
+            .values_list("weekday", "total")
+        )
+        imbalanced = [
+            (day.label, day_totals[day])
+            for day in Transaction.Weekday
+            if day_totals.get(day, ZERO) != ZERO
+        ]
         if imbalanced:
             # Build a helpful error message
             msg_parts = [f"{d}: {t}" for d, t in imbalanced]
@@ -117,26 +202,32 @@ class Week(models.Model):
             )
 
         # Update all players' total scores and also apply cashback
-        for player in Player.objects.all():
-            weekly_total = player.get_weekly_total()
-            player.total_score += weekly_total
-            if weekly_total >= 500:
-                player.total_score -= Decimal("100")
-                cashback_total += Decimal("100")
-            elif weekly_total >= 200:
-                player.total_score -= Decimal("50")
-                cashback_total += Decimal("50")
-            elif weekly_total <= -200 and weekly_total > -500:
-                player.total_score += Decimal("50")
-                cashback_total -= Decimal("50")
-            elif weekly_total <= -500:
-                player.total_score += Decimal("100")
-                cashback_total -= Decimal("100")
-            else:
-                pass
-            player.save()
+        deltas = []
+        settlements = current_week.get_settlements().values_list(
+            "id", "weekly_total", "cashback_change"
+        )
+        for player_id, weekly_total, cashback_change in settlements.iterator(
+            chunk_size=500
+        ):
+            cashback_total -= cashback_change
+            if weekly_total or cashback_change:
+                deltas.append((player_id, weekly_total + cashback_change))
+        # Apply relative F() updates so a pay-in committed after the read isn't overwritten
+        for start in range(0, len(deltas), 500):
+            batch = deltas[start : start + 500]
+            Player.objects.filter(pk__in=[player_id for player_id, _ in batch]).update(
+                total_score=F("total_score")
+                + Case(
+                    *(
+                        When(pk=player_id, then=Value(delta))
+                        for player_id, delta in batch
+                    ),
+                    output_field=AMOUNT_FIELD,
+                )
+            )
+        Player.objects.update(current_weekly_total=ZERO, current_payin_payout=ZERO)
         # Update pool balance
-        if cashback_total != 0:
+        if cashback_total != ZERO:
             pool.balance += cashback_total
             pool.save()
             Transaction.objects.create(
@@ -162,28 +253,33 @@ class Week(models.Model):
 
 
 class Transaction(models.Model):
-    class TransactionType(models.TextChoices):
-        PAYIN_OUT = "PAYIN/OUT", "Pay-in/Out"
-        SESSION = "SESSION", "Session Score"
-        CASHBACK = "CASHBACK", "Cashback"
-        CASHBACK_DEDUCTION = "CASHBACK_DEDUCTION", "Cashback Deduction"
-        POOL_ADDITION = "POOL_ADDITION", "Pool Addition"
-
-    class Weekday(models.TextChoices):
-        MONDAY = "Monday", "Monday"
-        TUESDAY = "Tuesday", "Tuesday"
-        WEDNESDAY = "Wednesday", "Wednesday"
-        THURSDAY = "Thursday", "Thursday"
-        FRIDAY = "Friday", "Friday"
-        SATURDAY = "Saturday", "Saturday"
-        SUNDAY = "Sunday", "Sunday"
+    class TransactionType(models.IntegerChoices):
+        PAYIN_OUT = 1, "Pay-in/Out"
+        SESSION = 2, "Session Score"
+        CASHBACK = 3, "Cashback"
+        CASHBACK_DEDUCTION = 4, "Cashback Deduction"
+        POOL_ADDITION = 5, "Pool Addition"
+
+    # Player running-total column maintained for each transaction type
+    RUNNING_TOTAL_FIELDS = {
+        TransactionType.SESSION: "current_weekly_total",
+        TransactionType.PAYIN_OUT: "current_payin_payout",
+    }
+
+    # ISO weekday numbers, so date.isoweekday() maps straight onto them
+    class Weekday(models.IntegerChoices):
+        MONDAY = 1, "Monday"
+        TUESDAY = 2, "Tuesday"
+        WEDNESDAY = 3, "Wednesday"
+        THURSDAY = 4, "Thursday"
+        FRIDAY = 5, "Friday"
+        SATURDAY = 6, "Saturday"
+        SUNDAY = 7, "Sunday"
 
     player = models.ForeignKey(Player, on_delete=models.CASCADE, null=True, blank=True)
     week = models.ForeignKey(Week, on_delete=models.CASCADE)
-    transaction_type = models.CharField(max_length=20, choices=TransactionType.choices)
-    weekday = models.CharField(
-        max_length=10, choices=Weekday.choices, null=True, blank=True
-    )
+    transaction_type = models.SmallIntegerField(choices=TransactionType.choices)
+    weekday = models.SmallIntegerField(choices=Weekday.choices, null=True, blank=True)
     value = models.DecimalField(max_digits=10, decimal_places=2)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -191,35 +287,85 @@ class Transaction(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["week", "player"]),
+            models.Index(fields=["week", "transaction_type", "weekday"]),
+            models.Index(fields=["week", "is_reverted"]),
+        ]
 
     def __str__(self):
         player_name = self.player.name if self.player else "Pool"
         return f"{player_name} - {self.get_transaction_type_display()} - {self.value}"
 
-    def revert(self):
-        """Revert this transaction"""
-        if not self.is_reverted:
-            # Create a reversing transaction
-            Transaction.objects.create(
-                player=self.player,
-                week=self.week,
-                transaction_type=self.transaction_type,
-                weekday=self.weekday,
-                value=-self.value,
-                description=f"Reversal of transaction #{self.id}",
+    @classmethod
+    def adjust_running_total(cls, player_id, week_id, transaction_type, amount):
+        """Add ``amount`` to the player's running total for ``transaction_type``
+
+        Only current-week SESSION and PAYIN/OUT rows count towards the totals;
+        the week check runs inside the UPDATE so no Week row is loaded.
+        """
+        field = cls.RUNNING_TOTAL_FIELDS.get(transaction_type)
+        if player_id and field:
+            Player.objects.filter(
+                Exists(Week.objects.filter(pk=week_id, is_current=True)),
+                pk=player_id,
+            ).update(**{field: F(field) + amount})
+
+    def save(self, *args, **kwargs):
+        """Save the transaction and keep the player's weekly running totals in sync"""
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                previous = (
+                    Transaction.objects.filter(pk=self.pk)
+                    .values_list("player_id", "week_id", "transaction_type", "value")
+                    .first()
+                )
+            super().save(*args, **kwargs)
+            # Back out what the stored row contributed, then apply the saved values
+            if previous is not None:
+                player_id, week_id, transaction_type, value = previous
+                self.adjust_running_total(player_id, week_id, transaction_type, -value)
+            self.adjust_running_total(
+                self.player_id, self.week_id, self.transaction_type, self.value
             )
-            # Adjust player's total_score for PAYIN/OUT reversals
-            if self.player and self.transaction_type == "PAYIN/OUT":
-                self.player.total_score -= self.value
-                self.player.save()
-            # Adjust pool balance for PAYIN/OUT reversals
-            if self.transaction_type == "PAYIN/OUT":
-                pool = Pool.get_pool()
-                pool.balance -= self.value
-                pool.save()
 
-            self.is_reverted = True
-            self.save()
+    @transaction.atomic
+    def revert(self):
+        """Revert this transaction
+
+        Returns False if the transaction had already been reverted.
+        """
+        # Flip the flag with a conditional UPDATE so concurrent reverts can't both apply
+        if not Transaction.objects.filter(pk=self.pk, is_reverted=False).update(
+            is_reverted=True
+        ):
+            return False
+        self.is_reverted = True
+
+        # Create a reversing transaction
+        Transaction.objects.create(
+            player=self.player,
+            week=self.week,
+            transaction_type=self.transaction_type,
+            weekday=self.weekday,
+            value=-self.value,
+            description=f"Reversal of transaction #{self.id}",
+        )
+        # Adjust player's total_score for PAYIN/OUT reversals
+        if (
+            self.player_id
+            and self.transaction_type == Transaction.TransactionType.PAYIN_OUT
+        ):
+            Player.objects.filter(pk=self.player_id).update(
+                total_score=F("total_score") - self.value
+            )
+        # Adjust pool balance for PAYIN/OUT reversals
+        if self.transaction_type == Transaction.TransactionType.PAYIN_OUT:
+            pool = Pool.get_pool_for_update()
+            pool.balance -= self.value
+            pool.save()
+        return True
 
 
 class Pool(models.Model):
@@ -232,5 +378,16 @@ class Pool(models.Model):
         pool, created = cls.objects.get_or_create(id=1)
         return pool
 
+    @classmethod
+    def get_pool_for_update(cls):
+        """Get or create the pool singleton, locking its row until the transaction ends"""
+        pool, created = cls.objects.select_for_update().get_or_create(id=1)
+        return pool
+
+    @classmethod
+    def get_pool_cached(cls):
+        """Get the pool singleton from the cache, for display-only use"""
+        return cache.get_or_set(POOL_CACHE_KEY, cls.get_pool, timeout=60)
+
     def __str__(self):
         return f"Pool: {self.balance}"
@@ -0,0 +1,84 @@
+# signals.py
+import time
+from functools import partial
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import (
+    Player,
+    Pool,
+    Transaction,
+    PLAYER_CHOICES_CACHE_KEY,
+    POOL_CACHE_KEY,
+    SCOREBOARD_TABLE_CACHE_KEY,
+    SCOREBOARD_TABLE_VERSION_KEY,
+)
+
+
+def bump_scoreboard_table_version():
+    """Advance the version that the cached scoreboard table is fingerprinted with"""
+    # Seeded from the clock so an evicted counter never restarts at a version
+    # an older cached table was stored under
+    cache.add(SCOREBOARD_TABLE_VERSION_KEY, time.time_ns(), None)
+    try:
+        cache.incr(SCOREBOARD_TABLE_VERSION_KEY)
+    except ValueError:
+        cache.set(SCOREBOARD_TABLE_VERSION_KEY, time.time_ns(), None)
+
+
+def invalidate_scoreboard_table():
+    """Invalidate the cached scoreboard table now and again once the change is committed
+
+    The second bump catches a render that read the version before this write
+    committed and stores its table afterwards.
+    """
+    cache.delete(SCOREBOARD_TABLE_CACHE_KEY)
+    bump_scoreboard_table_version()
+    transaction.on_commit(bump_scoreboard_table_version)
+
+
+@receiver(post_save, sender=Player)
+def invalidate_player_caches_on_save(sender, update_fields=None, **kwargs):
+    """Drop the cached scoreboard table, and the player choices when a player is added or renamed"""
+    invalidate_scoreboard_table()
+    if update_fields is not None and "name" not in update_fields:
+        return
+    cache.delete(PLAYER_CHOICES_CACHE_KEY)
+
+
+@receiver(post_delete, sender=Player)
+def invalidate_player_caches_on_delete(sender, **kwargs):
+    """Drop the cached player choices and scoreboard table when a player is removed"""
+    cache.delete(PLAYER_CHOICES_CACHE_KEY)
+    invalidate_scoreboard_table()
+
+
+@receiver(post_save, sender=Pool)
+def invalidate_pool_on_save(sender, **kwargs):
+    """Drop the cached pool once the new balance is committed"""
+    cache.delete(POOL_CACHE_KEY)
+    transaction.on_commit(partial(cache.delete, POOL_CACHE_KEY))
+
+
+@receiver(post_delete, sender=Transaction)
+def reverse_running_total_on_delete(sender, instance, **kwargs):
+    """Back a deleted transaction out of the player's weekly running totals"""
+    if (
+        not instance.player_id
+        or instance.transaction_type not in Transaction.RUNNING_TOTAL_FIELDS
+    ):
+        return
+    Transaction.adjust_running_total(
+        instance.player_id,
+        instance.week_id,
+        instance.transaction_type,
+        -instance.value,
+    )
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+def invalidate_scoreboard_table_on_transaction_change(sender, **kwargs):
+    """Drop the cached scoreboard table when a transaction is added, edited or removed"""
+    invalidate_scoreboard_table()
@@ -1 +1,507 @@
-# Create your tests here.
+import json
+import re
+from decimal import Decimal
+
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import SCOREBOARD_TABLE_CACHE_KEY, Player, Transaction, Week
+
+
+class SettlementTests(TestCase):
+    def setUp(self):
+        self.week = Week.get_current_week()
+
+    def add_sessions(self, player, values):
+        for value in values:
+            Transaction.objects.create(
+                player=player,
+                week=self.week,
+                transaction_type=Transaction.TransactionType.SESSION,
+                weekday=Transaction.Weekday.MONDAY,
+                value=Decimal(value),
+            )
+
+    def test_cashback_tier_boundaries_use_rounded_totals(self):
+        """Sums landing exactly on a tier threshold fall into that tier"""
+        winner = Player.objects.create(name="Winner")
+        loser = Player.objects.create(name="Loser")
+        self.add_sessions(winner, ["73.03", "255.37", "225.77", "-354.17"])
+        self.add_sessions(loser, ["-73.03", "-255.37", "-225.77", "354.17"])
+
+        settlements = {p.name: p for p in self.week.get_settlements()}
+        self.assertEqual(settlements["Winner"].weekly_total, Decimal("200.00"))
+        self.assertEqual(settlements["Winner"].cashback_change, Decimal("-50"))
+        self.assertEqual(settlements["Loser"].weekly_total, Decimal("-200.00"))
+        self.assertEqual(settlements["Loser"].cashback_change, Decimal("50"))
+
+    def test_start_new_week_settles_boundary_cashback(self):
+        winner = Player.objects.create(name="Winner")
+        loser = Player.objects.create(name="Loser")
+        self.add_sessions(winner, ["73.03", "255.37", "225.77", "-354.17"])
+        self.add_sessions(loser, ["-73.03", "-255.37", "-225.77", "354.17"])
+
+        Week.start_new_week()
+
+        winner.refresh_from_db()
+        loser.refresh_from_db()
+        self.assertEqual(winner.total_score, Decimal("150.00"))
+        self.assertEqual(loser.total_score, Decimal("-150.00"))
+
+
+class RolloverTests(TestCase):
+    def setUp(self):
+        self.week = Week.get_current_week()
+
+    def test_start_new_week_finalizes_and_opens_next_week(self):
+        new_week = Week.start_new_week()
+
+        self.week.refresh_from_db()
+        self.assertFalse(self.week.is_current)
+        self.assertIsNotNone(self.week.end_date)
+        self.assertTrue(new_week.is_current)
+        self.assertEqual(new_week.week_number, self.week.week_number + 1)
+        self.assertEqual(Week.objects.filter(is_current=True).get(), new_week)
+
+    def test_rollover_that_lost_the_race_does_not_settle(self):
+        # A second rollover that read the week before the first one committed
+        stale_week = Week.objects.get(pk=self.week.pk)
+        Week.start_new_week()
+
+        with mock.patch.object(Week, "get_current_week", return_value=stale_week):
+            with self.assertRaises(ValueError):
+                Week.start_new_week()
+        self.assertEqual(Week.objects.count(), 2)
+        self.assertEqual(Week.objects.filter(is_current=True).count(), 1)
+
+    def test_rollover_keeps_score_changes_committed_after_the_settlement_read(self):
+        winner = Player.objects.create(name="Winner", total_score=Decimal("20"))
+        loser = Player.objects.create(name="Loser")
+        for player, value in ((winner, "250"), (loser, "-250")):
+            Transaction.objects.create(
+                player=player,
+                week=self.week,
+                transaction_type=Transaction.TransactionType.SESSION,
+                weekday=Transaction.Weekday.MONDAY,
+                value=Decimal(value),
+            )
+        get_settlements = Week.get_settlements
+
+        class PayInAfterRead:
+            """Settlement rows, followed by a pay-in from another request"""
+
+            def __init__(self, queryset):
+                self.queryset = queryset
+
+            def values_list(self, *fields):
+                self.queryset = self.queryset.values_list(*fields)
+                return self
+
+            def iterator(self, chunk_size):
+                rows = list(self.queryset)
+                Player.objects.filter(pk=winner.pk).update(
+                    total_score=F("total_score") + 10
+                )
+                return iter(rows)
+
+        with mock.patch.object(
+            Week, "get_settlements", lambda week: PayInAfterRead(get_settlements(week))
+        ):
+            Week.start_new_week()
+
+        winner.refresh_from_db()
+        loser.refresh_from_db()
+        # 20 + 10 pay-in + 250 weekly - 50 cashback
+        self.assertEqual(winner.total_score, Decimal("230"))
+        self.assertEqual(loser.total_score, Decimal("-200"))
+
+
+class RunningTotalTests(TestCase):
+    def setUp(self):
+        self.week = Week.get_current_week()
+        self.player = Player.objects.create(name="Alice")
+
+    def create(self, transaction_type, value, weekday=None):
+        return Transaction.objects.create(
+            player=self.player,
+            week=self.week,
+            transaction_type=transaction_type,
+            weekday=weekday,
+            value=Decimal(value),
+        )
+
+    def assertTotals(self, weekly_total, payin_payout):
+        self.player.refresh_from_db()
+        self.assertEqual(self.player.current_weekly_total, Decimal(weekly_total))
+        self.assertEqual(self.player.current_payin_payout, Decimal(payin_payout))
+
+    def test_insert(self):
+        self.create(
+            Transaction.TransactionType.SESSION, "300", Transaction.Weekday.MONDAY
+        )
+        self.create(Transaction.TransactionType.PAYIN_OUT, "-40")
+        self.assertTotals("300", "-40")
+
+    def test_revert(self):
+        session = self.create(
+            Transaction.TransactionType.SESSION, "300", Transaction.Weekday.MONDAY
+        )
+        payin = self.create(Transaction.TransactionType.PAYIN_OUT, "-40")
+        session.revert()
+        payin.revert()
+        self.assertTotals("0", "0")
+
+    def test_edit_value(self):
+        session = self.create(
+            Transaction.TransactionType.SESSION, "300", Transaction.Weekday.MONDAY
+        )
+        session.value = Decimal("100")
+        session.save()
+        self.assertTotals("100", "0")
+
+    def test_edit_type(self):
+        txn = self.create(
+            Transaction.TransactionType.SESSION, "300", Transaction.Weekday.MONDAY
+        )
+        txn.transaction_type = Transaction.TransactionType.PAYIN_OUT
+        txn.weekday = None
+        txn.save()
+        self.assertTotals("0", "300")
+
+    def test_edit_moves_to_past_week(self):
+        past_week = Week.objects.create(
+            week_number=0,
+            year=self.week.year,
+            start_date=self.week.start_date,
+            is_current=False,
+        )
+        session = self.create(
+            Transaction.TransactionType.SESSION, "300", Transaction.Weekday.MONDAY
+        )
+        session.week = past_week
+        session.save()
+        self.assertTotals("0", "0")
+
+    def test_delete(self):
+        self.create(
+            Transaction.TransactionType.SESSION, "300", Transaction.Weekday.MONDAY
+        )
+        self.create(
+            Transaction.TransactionType.SESSION, "-300", Transaction.Weekday.TUESDAY
+        ).delete()
+        Transaction.objects.filter(
+            transaction_type=Transaction.TransactionType.SESSION
+        ).delete()
+        self.create(Transaction.TransactionType.PAYIN_OUT, "25").delete()
+        self.assertTotals("0", "0")
+
+    def test_save_checks_week_inside_the_update(self):
+        txn = Transaction(
+            player_id=self.player.id,
+            week_id=self.week.id,
+            transaction_type=Transaction.TransactionType.SESSION,
+            weekday=Transaction.Weekday.MONDAY,
+            value=Decimal("5"),
+        )
+        with CaptureQueriesContext(connection) as queries:
+            txn.save()
+            txn.value = Decimal("7")
+            txn.save()
+        self.assertFalse(
+            [q for q in queries if q["sql"].startswith('SELECT "scoreboard_week"')]
+        )
+        self.assertTotals("7", "0")
+
+    def test_past_week_rows_do_not_count(self):
+        self.week.is_current = False
+        self.week.save()
+        self.create(
+            Transaction.TransactionType.SESSION, "300", Transaction.Weekday.MONDAY
+        )
+        self.assertTotals("0", "0")
+
+    def test_rebuild_running_totals_command(self):
+        self.create(
+            Transaction.TransactionType.SESSION, "300", Transaction.Weekday.MONDAY
+        )
+        self.create(Transaction.TransactionType.PAYIN_OUT, "-40")
+        other = Player.objects.create(name="Bob")
+        # Writes that bypass save() leave the counters out of step
+        Transaction.objects.filter(
+            transaction_type=Transaction.TransactionType.SESSION
+        ).update(value=Decimal("120"))
+        Player.objects.update(current_weekly_total=Decimal("999"))
+
+        call_command("rebuild_running_totals", stdout=StringIO())
+
+        self.assertTotals("120", "-40")
+        other.refresh_from_db()
+        self.assertEqual(other.current_weekly_total, Decimal("0"))
+
+    def test_admin_edit_does_not_overwrite_running_totals(self):
+        admin_user = User.objects.create_superuser("admin", "a@example.com", "pw")
+        self.client.force_login(admin_user)
+        self.create(
+            Transaction.TransactionType.SESSION, "300", Transaction.Weekday.MONDAY
+        )
+        response = self.client.post(
+            reverse("admin:scoreboard_player_change", args=[self.player.id]),
+            {
+                "name": "Alicia",
+                "total_score": "0",
+                "current_weekly_total": "0",
+                "current_payin_payout": "0",
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.player.refresh_from_db()
+        self.assertEqual(self.player.name, "Alicia")
+        self.assertTotals("300", "0")
+
+
+class ScoreboardTableCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.week = Week.get_current_week()
+        self.player = Player.objects.create(name="Alice")
+
+    def get_dashboard(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(reverse("dashboard"))
+
+    def monday_cell(self, response):
+        match = re.search(
+            rf'id="score-{self.player.id}-Monday">\s*(.*?)\s*</div>',
+            response.content.decode(),
+        )
+        return match.group(1)
+
+    def test_table_is_cached_after_commit(self):
+        self.get_dashboard()
+        self.assertIsNotNone(cache.get(SCOREBOARD_TABLE_CACHE_KEY))
+
+    def test_edit_of_earlier_transaction_refreshes_table(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            session = Transaction.objects.create(
+                player=self.player,
+                week=self.week,
+                transaction_type=Transaction.TransactionType.SESSION,
+                weekday=Transaction.Weekday.MONDAY,
+                value=Decimal("300"),
+            )
+            Transaction.objects.create(
+                player=self.player,
+                week=self.week,
+                transaction_type=Transaction.TransactionType.PAYIN_OUT,
+                value=Decimal("10"),
+            )
+        self.assertEqual(self.monday_cell(self.get_dashboard()), "$300")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            session.value = Decimal("100")
+            session.save()
+        self.assertEqual(self.monday_cell(self.get_dashboard()), "$100")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            session.delete()
+        self.assertEqual(self.monday_cell(self.get_dashboard()), "-")
+
+    def test_render_racing_an_edit_is_not_served_stale(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            session = Transaction.objects.create(
+                player=self.player,
+                week=self.week,
+                transaction_type=Transaction.TransactionType.SESSION,
+                weekday=Transaction.Weekday.MONDAY,
+                value=Decimal("300"),
+            )
+        # A render reads the old rows, then an edit commits before the render
+        # stores its table
+        with self.captureOnCommitCallbacks() as render_callbacks:
+            self.assertEqual(
+                self.monday_cell(self.client.get(reverse("dashboard"))), "$300"
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            session.value = Decimal("100")
+            session.save()
+        for callback in render_callbacks:
+            callback()
+        self.assertEqual(self.monday_cell(self.get_dashboard()), "$100")
+
+
+class BulkSessionTests(TestCase):
+    def setUp(self):
+        self.week = Week.get_current_week()
+        self.alice = Player.objects.create(name="Alice")
+        self.bob = Player.objects.create(name="Bob")
+
+    def post(self, payload):
+        return self.client.post(
+            reverse("add_sessions_bulk_htmx"),
+            json.dumps(payload) if not isinstance(payload, str) else payload,
+            content_type="application/json",
+        )
+
+    def test_creates_sessions_and_updates_running_totals(self):
+        response = self.post(
+            [
+                {"player": self.alice.id, "weekday": 1, "value": 10.5},
+                {"player": str(self.bob.id), "weekday": 1, "value": "-10.5"},
+                {"player": self.alice.id, "weekday": 2, "value": 4},
+            ]
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "scoreboard-table-container")
+        self.assertEqual(
+            Transaction.objects.filter(
+                week=self.week, transaction_type=Transaction.TransactionType.SESSION
+            ).count(),
+            3,
+        )
+        self.alice.refresh_from_db()
+        self.bob.refresh_from_db()
+        self.assertEqual(self.alice.current_weekly_total, Decimal("14.5"))
+        self.assertEqual(self.bob.current_weekly_total, Decimal("-10.5"))
+
+    def test_rejects_invalid_entries(self):
+        player = self.alice.id
+        cases = [
+            "not json",
+            [],
+            {"player": player, "weekday": 1, "value": 1},
+            [1],
+            [{"weekday": 1, "value": 1}],
+            [{"player": True, "weekday": 1, "value": 1}],
+            [{"player": player, "weekday": 1, "value": True}],
+            [{"player": 1.7, "weekday": 1, "value": 1}],
+            [{"player": "1.7", "weekday": 1, "value": 1}],
+            [{"player": None, "weekday": 1, "value": 1}],
+            [{"player": 9999, "weekday": 1, "value": 1}],
+            [{"player": player, "weekday": "Funday", "value": 1}],
+            [{"player": player, "weekday": "Monday", "value": 1}],
+            [{"player": player, "weekday": 8, "value": 1}],
+            [{"player": player, "weekday": True, "value": 1}],
+            [{"player": player, "weekday": 1, "value": "abc"}],
+            [{"player": player, "weekday": 1, "value": "NaN"}],
+            [{"player": player, "weekday": 1, "value": "Infinity"}],
+            [{"player": player, "weekday": 1, "value": "1.005"}],
+            [{"player": player, "weekday": 1, "value": 1.005}],
+            [{"player": player, "weekday": 1, "value": "123456789.01"}],
+            [{"player": player, "weekday": 1, "value": [1]}],
+        ]
+        for payload in cases:
+            with self.subTest(payload=payload):
+                self.assertEqual(self.post(payload).status_code, 400)
+        self.assertFalse(Transaction.objects.exists())
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.current_weekly_total, Decimal("0"))
+
+    def test_rejects_finalized_week(self):
+        # The request fetched the week just before a rollover finalized it
+        Week.objects.filter(pk=self.week.pk).update(is_current=False)
+        with mock.patch.object(Week, "get_current_week", return_value=self.week):
+            response = self.post([{"player": self.alice.id, "weekday": 1, "value": 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_rejects_get(self):
+        response = self.client.get(reverse("add_sessions_bulk_htmx"))
+        self.assertEqual(response.status_code, 400)
+
+
+class ChoiceStorageTests(TestCase):
+    def setUp(self):
+        self.week = Week.get_current_week()
+        self.player = Player.objects.create(name="Alice")
+
+    def test_stores_integer_codes(self):
+        Transaction.objects.create(
+            player=self.player,
+            week=self.week,
+            transaction_type=Transaction.TransactionType.SESSION,
+            weekday=Transaction.Weekday.SUNDAY,
+            value=Decimal("5"),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT transaction_type, weekday FROM scoreboard_transaction"
+            )
+            self.assertEqual(cursor.fetchone(), (2, 7))
+
+    def test_add_session_takes_weekday_value(self):
+        url = reverse("add_session_htmx")
+        data = {"player": self.player.id, "value": "5"}
+        for weekday in ("Monday", "0", "8"):
+            with self.subTest(weekday=weekday):
+                response = self.client.post(url, {**data, "weekday": weekday})
+                self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, {**data, "weekday": "3"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            Transaction.objects.get().weekday, Transaction.Weekday.WEDNESDAY
+        )
+
+    def test_add_payin_out_takes_type_value(self):
+        url = reverse("add_transaction_htmx")
+        data = {"player": self.player.id, "value": "25"}
+        response = self.client.post(url, {**data, "transaction_type": "PAYIN/OUT"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, {**data, "transaction_type": "1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            Transaction.objects.get().transaction_type,
+            Transaction.TransactionType.PAYIN_OUT,
+        )
+
+    def test_history_shows_labels(self):
+        Transaction.objects.create(
+            player=self.player,
+            week=self.week,
+            transaction_type=Transaction.TransactionType.SESSION,
+            weekday=Transaction.Weekday.FRIDAY,
+            value=Decimal("5"),
+        )
+        response = self.client.get(reverse("transaction_history"))
+        self.assertContains(response, "Friday")
+        self.assertContains(response, "Session Score")
+
+
+class TransactionHistoryTests(TestCase):
+    def setUp(self):
+        self.week = Week.get_current_week()
+
+    def add_rows(self, count):
+        player = Player.objects.create(name=f"Player {count}")
+        for value in range(count):
+            Transaction.objects.create(
+                player=player,
+                week=self.week,
+                transaction_type=Transaction.TransactionType.SESSION,
+                weekday=Transaction.Weekday.MONDAY,
+                value=Decimal(value),
+            )
+        # Pool additions have no player
+        Transaction.objects.create(
+            week=self.week,
+            transaction_type=Transaction.TransactionType.POOL_ADDITION,
+            value=Decimal("5"),
+        )
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.add_rows(1)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse("transaction_history"))
+        self.add_rows(10)
+        with self.assertNumQueries(len(few)):
+            response = self.client.get(reverse("transaction_history"))
+        self.assertEqual(len(response.context["transactions"]), 13)
+        self.assertContains(response, "Player 10")
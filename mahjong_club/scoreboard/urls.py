@@ -5,6 +5,11 @@ urlpatterns = [
     path("", views.dashboard, name="dashboard"),
     path("add-transaction/", views.add_transaction, name="add_transaction"),
     path("add-session-htmx/", views.add_session_htmx, name="add_session_htmx"),
+    path(
+        "add-sessions-bulk-htmx/",
+        views.add_sessions_bulk_htmx,
+        name="add_sessions_bulk_htmx",
+    ),
     path(
         "add-transaction-htmx/", views.add_transaction_htmx, name="add_transaction_htmx"
     ),
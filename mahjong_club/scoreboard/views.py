@@ -1,79 +1,220 @@
 # views.py
+import hashlib
+import json
+import time
+from functools import partial
+from operator import attrgetter
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.db.models import Sum
-from .models import Player, Week, Transaction, Pool
+from django.db import transaction
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import (
+    Case,
+    F,
+    FilteredRelation,
+    Max,
+    Q,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
+from .models import (
+    Player,
+    Week,
+    Transaction,
+    Pool,
+    AMOUNT_FIELD,
+    SCOREBOARD_TABLE_CACHE_KEY,
+    SCOREBOARD_TABLE_VERSION_KEY,
+    WEEKDAY_NAMES,
+    ZERO,
+)
 from .forms import TransactionForm, PlayerForm
+from .signals import invalidate_scoreboard_table
 from django.template.loader import render_to_string
 from django.http import HttpResponse, HttpResponseBadRequest
-from decimal import Decimal
-from django.template.loader import render_to_string
-
-
-def dashboard(request):
-    """Main dashboard view showing all players and their scores"""
-    current_week = Week.get_current_week()
-    players = Player.objects.all()
-    pool = Pool.get_pool()
+from decimal import Decimal, InvalidOperation
+
+
+def _current_week(request):
+    """Get the current week, fetched at most once per request"""
+    if not hasattr(request, "_current_week"):
+        request._current_week = Week.get_current_week()
+    return request._current_week
+
+
+# Player columns rendered by the scoreboard table
+_SCOREBOARD_PLAYER_FIELDS = (
+    "id",
+    "name",
+    "total_score",
+    "current_weekly_total",
+    "current_payin_payout",
+)
+
+# Per-weekday session score annotations, in WEEKDAY_NAMES order
+_SESSION_FIELDS = tuple(f"session_{day.lower()}" for day in WEEKDAY_NAMES)
+_session_scores = attrgetter(*_SESSION_FIELDS)
+
+SCOREBOARD_ROW_CACHE_PREFIX = "scoreboard:row:"
+
+
+def _build_dashboard_rows(current_week, players):
+    """Build scoreboard rows for ``players`` in a single annotated query"""
+    # Weekly and pay-in/out totals are kept on Player; only the per-weekday
+    # session scores need aggregating, over this week's SESSION rows
+    players = players.annotate(
+        week_sessions=FilteredRelation(
+            "transaction",
+            condition=Q(
+                transaction__week=current_week,
+                transaction__transaction_type=Transaction.TransactionType.SESSION,
+            ),
+        ),
+        **{
+            field: Coalesce(
+                Sum("week_sessions__value", filter=Q(week_sessions__weekday=day)),
+                Value(ZERO),
+                output_field=AMOUNT_FIELD,
+            )
+            for day, field in zip(Transaction.Weekday, _SESSION_FIELDS)
+        },
+    ).order_by("name")
 
-    # Prepare player data
     player_data = []
-    weekdays = [
-        "Monday",
-        "Tuesday",
-        "Wednesday",
-        "Thursday",
-        "Friday",
-        "Saturday",
-        "Sunday",
-    ]
-
     for player in players:
-        session_scores = player.get_session_scores()
         # build list of (weekday, score) pairs to allow weekday-aware rendering in template
-        session_list = [(day, session_scores.get(day, 0)) for day in weekdays]
+        session_list = list(zip(Transaction.Weekday, _session_scores(player)))
         player_info = {
             "player": player,
             "total_score": player.total_score,
-            "payin_payout": player.get_payin_payout_balance(),
-            "weekly_total": player.get_weekly_total(),
+            "payin_payout": player.current_payin_payout,
+            "weekly_total": player.current_weekly_total,
             "sessions": session_list,
         }
         player_data.append(player_info)
+    return player_data
+
+
+def _render_scoreboard_rows(player_data):
+    """Render each scoreboard row, reusing cached HTML for rows whose values are unchanged"""
+    # Key each row by the values it renders, so any change re-renders just that row
+    keys = [
+        SCOREBOARD_ROW_CACHE_PREFIX
+        + hashlib.md5(
+            repr(
+                (
+                    data["player"].id,
+                    data["player"].name,
+                    data["total_score"],
+                    data["payin_payout"],
+                    data["weekly_total"],
+                    data["sessions"],
+                )
+            ).encode(),
+            usedforsecurity=False,
+        ).hexdigest()
+        for data in player_data
+    ]
+    cached = cache.get_many(keys)
+    rows = []
+    rendered = {}
+    for key, data in zip(keys, player_data):
+        html = cached.get(key)
+        if html is None:
+            html = render_to_string(
+                "mahjong/partials/scoreboard_row.html",
+                {"data": data, "payin_out": Transaction.TransactionType.PAYIN_OUT},
+            )
+            rendered[key] = html
+        rows.append(html)
+    if rendered:
+        cache.set_many(rendered, 300)
+    return rows
+
+
+def _render_scoreboard_table(current_week):
+    """Render the scoreboard table, reusing the cached HTML while nothing has changed
+
+    Transaction and Player changes bump a version counter through signals,
+    both when they happen and once they commit. The version is read before
+    any rows, so a table rendered from rows that a concurrent write then
+    changes is stored under a version that is already out of date. The
+    latest transaction id additionally catches writes that skip signals, such
+    as bulk_create.
+    """
+    version = cache.get_or_set(SCOREBOARD_TABLE_VERSION_KEY, time.time_ns, None)
+    latest = Transaction.objects.filter(week=current_week).aggregate(latest=Max("id"))[
+        "latest"
+    ]
+    fingerprint = (current_week.id, latest, version)
+    cached = cache.get(SCOREBOARD_TABLE_CACHE_KEY)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+
+    # Rendered without the request so the HTML holds nothing user-specific;
+    # the CSRF token is sent through hx-headers on the dashboard page instead
+    players = Player.objects.only(*_SCOREBOARD_PLAYER_FIELDS)
+    context = {
+        "rows": _render_scoreboard_rows(_build_dashboard_rows(current_week, players)),
+        "weekdays": WEEKDAY_NAMES,
+    }
+    html = render_to_string("mahjong/partials/scoreboard_table.html", context)
+    # Store only once committed, so a rolled-back or still-open write is never cached
+    transaction.on_commit(
+        partial(cache.set, SCOREBOARD_TABLE_CACHE_KEY, (fingerprint, html), 300)
+    )
+    return html
+
+
+def dashboard(request):
+    """Main dashboard view showing all players and their scores"""
+    current_week = _current_week(request)
+    pool = Pool.get_pool_cached()
 
     context = {
-        "player_data": player_data,
-        "weekdays": weekdays,
+        "scoreboard_table": _render_scoreboard_table(current_week),
         "current_week": current_week,
         "pool": pool,
     }
     return render(request, "mahjong/dashboard.html", context)
 
 
+@transaction.atomic
 def add_transaction(request):
     """Add a new transaction (score input)"""
     if request.method == "POST":
         form = TransactionForm(request.POST)
         if form.is_valid():
-            transaction = form.save(commit=False)
-            transaction.week = Week.get_current_week()
+            txn = form.save(commit=False)
+            txn.week = _current_week(request)
 
             # Validate SESSION type must have weekday
-            if transaction.transaction_type == "SESSION" and not transaction.weekday:
+            if (
+                txn.transaction_type == Transaction.TransactionType.SESSION
+                and not txn.weekday
+            ):
                 messages.error(request, "Session transactions must specify a weekday.")
                 return render(request, "mahjong/add_transaction.html", {"form": form})
 
             # If PAYIN/OUT, update player's total_score
-            if transaction.transaction_type == "PAYIN/OUT" and transaction.player:
-                transaction.player.total_score += transaction.value
-                transaction.player.save()
+            if (
+                txn.transaction_type == Transaction.TransactionType.PAYIN_OUT
+                and txn.player
+            ):
+                Player.objects.filter(pk=txn.player_id).update(
+                    total_score=F("total_score") + txn.value
+                )
 
                 # Update pool balance as well
-                pool = Pool.get_pool()
-                pool.balance += transaction.value
+                pool = Pool.get_pool_for_update()
+                pool.balance += txn.value
                 pool.save()
 
-            transaction.save()
+            txn.save()
             messages.success(request, "Transaction added successfully!")
             return redirect("dashboard")
     else:
@@ -82,6 +223,7 @@ def add_transaction(request):
     return render(request, "mahjong/add_transaction.html", {"form": form})
 
 
+@transaction.atomic
 def add_session_htmx(request):
     """HTMX endpoint to add a SESSION transaction and return updated weekday cell fragment."""
     if request.method != "POST":
@@ -93,69 +235,142 @@ def add_session_htmx(request):
 
     if not player_id or not weekday or value in (None, ""):
         return HttpResponseBadRequest("Missing fields")
+    try:
+        weekday = Transaction.Weekday(int(weekday))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid weekday")
 
     try:
-        player = Player.objects.get(id=player_id)
+        player_id = int(player_id)
         value_dec = Decimal(value)
-    except Exception:
+    except (TypeError, ValueError, InvalidOperation):
+        return HttpResponseBadRequest("Invalid player or value")
+    if not value_dec.is_finite():
+        return HttpResponseBadRequest("Invalid player or value")
+
+    player = Player.objects.select_for_update().only("id").filter(id=player_id).first()
+    if player is None:
         return HttpResponseBadRequest("Invalid player or value")
 
-    transaction = Transaction.objects.create(
+    current_week = _current_week(request)
+    Transaction.objects.create(
         player=player,
-        week=Week.get_current_week(),
-        transaction_type="SESSION",
+        week=current_week,
+        transaction_type=Transaction.TransactionType.SESSION,
         weekday=weekday,
         value=value_dec,
     )
 
-    # Recompute the day's total across all players
-    day_total = Transaction.objects.filter(
-        week=Week.get_current_week(), transaction_type="SESSION", weekday=weekday
-    ).aggregate(total=Sum("value"))["total"] or Decimal("0")
+    # Render the whole scoreboard table and return it so the client can re-render
+    return HttpResponse(_render_scoreboard_table(current_week))
+
+
+def _json_int(value):
+    """Return a JSON integer (not a bool) or digit string as an int, else raise ValueError"""
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    if type(value) is not int:
+        raise ValueError("expected an integer")
+    return value
+
+
+def _parse_session_entry(entry):
+    """Parse one bulk session entry into (player id, weekday, value)
+
+    Raises ValueError for booleans, fractional ids, unknown weekdays and other
+    values that int() or Decimal() would otherwise coerce, and ValidationError
+    for values the amount column cannot store exactly.
+    """
+    value = entry["value"]
+    if type(value) not in (int, str, Decimal):
+        raise ValueError("value must be a number or numeric string")
+    value = Decimal(value)
+    # bulk_create skips model validation; reject non-finite values and values
+    # with more than 2 decimal places or 10 digits instead of rounding them
+    AMOUNT_FIELD.run_validators(value)
+    return (
+        _json_int(entry["player"]),
+        Transaction.Weekday(_json_int(entry["weekday"])),
+        value,
+    )
 
-    # Recompute player's session score for this weekday and weekly total
-    session_scores = player.get_session_scores()
-    player_weekly_total = player.get_weekly_total()
-    new_total = player.total_score + player_weekly_total
 
-    # Render the whole scoreboard table and return it so the client can re-render
-    context = {
-        "player_data": [],
-        "weekdays": [
-            "Monday",
-            "Tuesday",
-            "Wednesday",
-            "Thursday",
-            "Friday",
-            "Saturday",
-            "Sunday",
+@transaction.atomic
+def add_sessions_bulk_htmx(request):
+    """HTMX endpoint to add several SESSION transactions at once and return the updated scoreboard table.
+
+    Expects a JSON list of {"player": id, "weekday": day, "value": score} objects,
+    with ``day`` a Transaction.Weekday value (1 = Monday ... 7 = Sunday).
+    """
+    if request.method != "POST":
+        return HttpResponseBadRequest("Invalid method")
+
+    try:
+        entries = [
+            _parse_session_entry(entry)
+            # JSON numbers parse straight to Decimal; never through float
+            for entry in json.loads(request.body, parse_float=Decimal)
+        ]
+    except (KeyError, TypeError, ValueError, InvalidOperation, ValidationError):
+        return HttpResponseBadRequest("Invalid entries")
+
+    if not entries:
+        return HttpResponseBadRequest("Missing fields")
+
+    # Lock the week first, in the same order as Week.start_new_week, so these
+    # sessions cannot land in a week that a concurrent rollover has settled
+    current_week = (
+        Week.objects.select_for_update()
+        .filter(pk=_current_week(request).pk, is_current=True)
+        .first()
+    )
+    if current_week is None:
+        return HttpResponseBadRequest("The week was finalized; reload and try again")
+
+    player_ids = {player_id for player_id, _, _ in entries}
+    locked_ids = set(
+        Player.objects.select_for_update()
+        .filter(id__in=player_ids)
+        .values_list("id", flat=True)
+    )
+    if locked_ids != player_ids:
+        return HttpResponseBadRequest("Invalid player")
+
+    Transaction.objects.bulk_create(
+        [
+            Transaction(
+                player_id=player_id,
+                week=current_week,
+                transaction_type=Transaction.TransactionType.SESSION,
+                weekday=weekday,
+                value=value,
+            )
+            for player_id, weekday, value in entries
         ],
-    }
-    # Rebuild player_data for fresh render
-    current_week = Week.get_current_week()
-    players = Player.objects.all()
-    player_data = []
-    for p in players:
-        session_scores_p = p.get_session_scores()
-        session_list_p = [(d, session_scores_p.get(d, 0)) for d in context["weekdays"]]
-        player_data.append(
-            {
-                "player": p,
-                "total_score": p.total_score,
-                "payin_payout": p.get_payin_payout_balance(),
-                "weekly_total": p.get_weekly_total(),
-                "sessions": session_list_p,
-            }
+        batch_size=200,
+    )
+
+    # bulk_create skips Transaction.save() and its signals, so apply the weekly
+    # running totals and drop the cached table here
+    player_totals = {}
+    for player_id, _, value in entries:
+        player_totals[player_id] = player_totals.get(player_id, ZERO) + value
+    Player.objects.filter(id__in=player_totals).update(
+        current_weekly_total=F("current_weekly_total")
+        + Case(
+            *(
+                When(id=player_id, then=Value(total))
+                for player_id, total in player_totals.items()
+            ),
+            output_field=AMOUNT_FIELD,
         )
-    context["player_data"] = player_data
-    context["current_week"] = current_week
-    context["pool"] = Pool.get_pool()
-    html = render_to_string(
-        "mahjong/partials/scoreboard_table.html", context, request=request
     )
-    return HttpResponse(html)
+    invalidate_scoreboard_table()
+
+    return HttpResponse(_render_scoreboard_table(current_week))
 
 
+@transaction.atomic
 def add_transaction_htmx(request):
     """HTMX endpoint to add a PAYIN or PAYOUT transaction and return updated payin cell fragment."""
     if request.method != "POST":
@@ -168,82 +383,64 @@ def add_transaction_htmx(request):
     if not player_id or not transaction_type or value in (None, ""):
         return HttpResponseBadRequest("Missing fields")
 
-    # Accept the combined PAYIN/OUT transaction type
-    if transaction_type != "PAYIN/OUT":
+    # Accept the combined PAYIN/OUT transaction type, posted as its integer value
+    if transaction_type != str(Transaction.TransactionType.PAYIN_OUT.value):
         return HttpResponseBadRequest("Invalid transaction type")
+    transaction_type = Transaction.TransactionType.PAYIN_OUT
 
     try:
-        player = Player.objects.get(id=player_id)
+        player_id = int(player_id)
         value_dec = Decimal(value)
-    except Exception:
+    except (TypeError, ValueError, InvalidOperation):
+        return HttpResponseBadRequest("Invalid player or value")
+    if not value_dec.is_finite():
+        return HttpResponseBadRequest("Invalid player or value")
+
+    player = Player.objects.only("id").filter(id=player_id).first()
+    if player is None:
         return HttpResponseBadRequest("Invalid player or value")
 
-    transaction = Transaction.objects.create(
+    current_week = _current_week(request)
+    Transaction.objects.create(
         player=player,
-        week=Week.get_current_week(),
+        week=current_week,
         transaction_type=transaction_type,
         value=value_dec,
     )
 
     # Update player's total_score for PAYIN/OUT transactions
-    if transaction_type == "PAYIN/OUT" and player:
-        player.total_score += value_dec
-        player.save()
+    if transaction_type == Transaction.TransactionType.PAYIN_OUT and player:
+        Player.objects.filter(pk=player.pk).update(
+            total_score=F("total_score") + value_dec
+        )
 
     # Update pool balance accordingly (pay-ins increase pool, pay-outs decrease pool)
-    if transaction_type == "PAYIN/OUT":
-        pool = Pool.get_pool()
+    if transaction_type == Transaction.TransactionType.PAYIN_OUT:
+        pool = Pool.get_pool_for_update()
         pool.balance += value_dec
         pool.save()
 
-    # Recompute the player's payin/payout balance for current week
-    payin_total = Transaction.objects.filter(
-        player=player, week=Week.get_current_week(), transaction_type__in=("PAYIN/OUT",)
-    ).aggregate(total=Sum("value"))["total"] or Decimal("0")
-
     # After creating the transaction and updating player/pool, return the full scoreboard table
-    current_week = Week.get_current_week()
-    players = Player.objects.all()
-    weekdays = [
-        "Monday",
-        "Tuesday",
-        "Wednesday",
-        "Thursday",
-        "Friday",
-        "Saturday",
-        "Sunday",
-    ]
-    player_data = []
-    for p in players:
-        session_scores_p = p.get_session_scores()
-        session_list_p = [(d, session_scores_p.get(d, 0)) for d in weekdays]
-        player_data.append(
-            {
-                "player": p,
-                "total_score": p.total_score,
-                "payin_payout": p.get_payin_payout_balance(),
-                "weekly_total": p.get_weekly_total(),
-                "sessions": session_list_p,
-            }
-        )
-    context = {
-        "player_data": player_data,
-        "weekdays": weekdays,
-        "current_week": current_week,
-        "pool": Pool.get_pool(),
-    }
-    html = render_to_string(
-        "mahjong/partials/scoreboard_table.html", context, request=request
-    )
-    return HttpResponse(html)
+    return HttpResponse(_render_scoreboard_table(current_week))
 
 
 def transaction_history(request):
     """View transaction history with revert capability"""
-    current_week = Week.get_current_week()
-    transactions = Transaction.objects.filter(
-        week=current_week, is_reverted=False
-    ).select_related("player", "week")
+    current_week = _current_week(request)
+    # Only the columns the history table renders; the week is shown once from current_week
+    transactions = (
+        Transaction.objects.filter(week=current_week, is_reverted=False)
+        .select_related("player")
+        .only(
+            "id",
+            "created_at",
+            "player__name",
+            "transaction_type",
+            "weekday",
+            "value",
+            "description",
+        )
+    )
 
     context = {
         "transactions": transactions,
@@ -254,16 +451,17 @@ def transaction_history(request):
 
 def revert_transaction(request, transaction_id):
     """Revert a specific transaction"""
-    transaction = get_object_or_404(Transaction, id=transaction_id)
-    current_week = Week.get_current_week()
-    if transaction.week != current_week:
+    txn = get_object_or_404(
+        Transaction.objects.select_related("player", "week"), id=transaction_id
+    )
+    current_week = _current_week(request)
+    if txn.week_id != current_week.id:
         messages.error(
             request, "Only transactions from the current week can be reverted."
         )
         return redirect("transaction_history")
 
-    if not transaction.is_reverted:
-        transaction.revert()
+    if txn.revert():
         messages.success(request, f"Transaction #{transaction_id} has been reverted.")
     else:
         messages.warning(request, "This transaction has already been reverted.")
@@ -286,57 +484,22 @@ def new_week(request):
             return redirect("dashboard")
 
     # Show confirmation page
-    from decimal import Decimal
-
-    current_week = Week.get_current_week()
-    players = Player.objects.all()
+    current_week = _current_week(request)
+    # Weekly totals (SESSION only) and cashback come from the same query start_new_week uses
+    players = current_week.get_settlements().only("id", "name", "total_score")
 
-    # Calculate original weekly totals (before cashback)
-    player_totals = {}
-    for player in players:
-        # Only include SESSION transactions for the weekly totals preview — exclude PAYIN/OUT
-        original_total = Transaction.objects.filter(
-            player=player,
-            week=current_week,
-            transaction_type="SESSION",
-        ).aggregate(total=Sum("value"))["total"] or Decimal("0")
-        player_totals[player.id] = original_total
-
-    # Calculate cashback changes using the same rules as Week.start_new_week
     # cashback_change is the amount applied to the player's total_score (negative = deduction for winners, positive = bonus for losers)
-    total_cashback = Decimal(
-        "0"
-    )  # net amount that will be applied to the pool (positive => pool gains)
-    cashback_change_map = {}
-    for player in players:
-        weekly_total = player_totals[player.id]
-        cashback_change = Decimal("0")
-        if weekly_total >= Decimal("500"):
-            cashback_change = Decimal("-100")  # winner pays 100
-            total_cashback += Decimal("100")
-        elif weekly_total >= Decimal("200"):
-            cashback_change = Decimal("-50")  # winner pays 50
-            total_cashback += Decimal("50")
-        elif weekly_total <= Decimal("-200") and weekly_total > Decimal("-500"):
-            cashback_change = Decimal("50")  # loser receives 50
-            total_cashback -= Decimal("50")
-        elif weekly_total <= Decimal("-500"):
-            cashback_change = Decimal("100")  # loser receives 100
-            total_cashback -= Decimal("100")
-        cashback_change_map[player.id] = cashback_change
-
-    # Preview what will happen
+    # total_cashback is the net amount applied to the pool (positive => pool gains)
+    total_cashback = ZERO
     preview_data = []
     for player in players:
-        original_weekly = player_totals[player.id]
-        cashback_change = cashback_change_map.get(player.id, Decimal("0"))
-        final_weekly = original_weekly + cashback_change
-
+        total_cashback -= player.cashback_change
+        final_weekly = player.weekly_total + player.cashback_change
         preview_data.append(
             {
                 "player": player,
-                "weekly_total": original_weekly,
-                "cashback_change": cashback_change,
+                "weekly_total": player.weekly_total,
+                "cashback_change": player.cashback_change,
                 "final_weekly": final_weekly,
                 "new_total": player.total_score + final_weekly,
             }
@@ -370,8 +533,8 @@ def manage_players(request):
 
 
 def week_history(request):
-    """View history of all weeks"""
-    weeks = Week.objects.all()
+    """View history of all weeks, a page at a time"""
+    weeks = Paginator(Week.objects.all(), 50).get_page(request.GET.get("page"))
     context = {
         "weeks": weeks,
     }